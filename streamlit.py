@@ -2,31 +2,62 @@ import streamlit as st
 import os
 import json
 import random
+import secrets
 from pathlib import Path
 from datetime import datetime
 import requests
 
-# Initialize session state
-if 'current_sample_idx' not in st.session_state:
-    st.session_state.current_sample_idx = 0
-if 'sample_order' not in st.session_state:
-    st.session_state.sample_order = []
-if 'ratings' not in st.session_state:
-    st.session_state.ratings = {}
-if 'samples' not in st.session_state:
-    st.session_state.samples = None  # Will be initialized after function definitions
+try:
+    import orjson
+except ImportError:  # Optional faster JSON encoder
+    orjson = None
+
+# Initialize session state. The script reruns top to bottom on every
+# interaction, so only cheap constants go here and setdefault keeps existing values
+SESSION_DEFAULTS = {
+    'current_sample_idx': 0,
+    'sample_order': [],
+    'ratings': {},
+    'samples': None,  # Will be initialized after function definitions
+    'audio_blobs': {},
+}
+for key, value in SESSION_DEFAULTS.items():
+    st.session_state.setdefault(key, value)
+if 'session_start' not in st.session_state:
+    st.session_state.session_start = datetime.now()
+if 'session_token' not in st.session_state:
+    st.session_state.session_token = secrets.token_hex(3)  # Disambiguates sessions started in the same second
 
 # Configuration
 SAMPLES_DIR = "evaluation_samples"
 RESULTS_DIR = "evaluation_results"
-os.makedirs(RESULTS_DIR, exist_ok=True)
 
 # Sample categories following Image2Reverb
 SCENE_CATEGORIES = ["small", "medium", "large", "outdoor"]
 SAMPLES_PER_CATEGORY = 2  # Following Image2Reverb's 8 total samples
 
+# Fallback prompts for samples without a description file
+DEMO_PROMPTS = {
+    'small': (
+        "A small tiled bathroom with hard surfaces and minimal absorption",
+        "A compact bedroom with carpet flooring and soft furnishings"
+    ),
+    'medium': (
+        "A medium-sized classroom with concrete walls and large windows",
+        "A living room with wooden floors and moderate furnishing"
+    ),
+    'large': (
+        "A large cathedral with stone walls and high vaulted ceilings",
+        "A spacious concert hall with acoustic treatment panels"
+    ),
+    'outdoor': (
+        "An open field with no nearby reflective surfaces",
+        "A desert landscape with distant rock formations"
+    )
+}
+
 # CSS for better audio player and UI
-st.markdown("""
+CUSTOM_CSS = """
     <style>
     .stAudio > audio {
         width: 100%;
@@ -47,10 +78,19 @@ st.markdown("""
         border-left: 4px solid #1e88e5;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+# Streamlit drops elements that are not re-emitted on a rerun, so the style
+# block has to be sent every time rather than cached
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
-def load_evaluation_samples():
-    """Load all evaluation samples from directory structure"""
+@st.cache_data(show_spinner=False)
+def load_evaluation_samples(samples_dir):
+    """Load all evaluation samples from directory structure
+
+    Returns a tuple of (samples, found) where found is False if the
+    samples directory does not exist. UI messages are left to the caller
+    so the result can be cached.
+    """
     samples = []
     
     # Expected structure:
@@ -62,105 +102,117 @@ def load_evaluation_samples():
     #       text2reverb_wet.wav
     #       ground_truth_wet.wav (for comparison if available)
     
+    # Resolve the samples directory once; entry paths below derive from it
+    base_dir = Path(samples_dir).resolve()
+    
     # Check if samples directory exists
-    if not os.path.exists(SAMPLES_DIR):
-        st.error(f"Evaluation samples directory not found: {SAMPLES_DIR}")
-        return []
-    
-    # Scan directory structure for real samples
-    for category in os.listdir(SAMPLES_DIR):
-        category_path = os.path.join(SAMPLES_DIR, category)
-        if not os.path.isdir(category_path):
-            continue
-            
-        for sample_dir in os.listdir(category_path):
-            sample_path = os.path.join(category_path, sample_dir)
-            if not os.path.isdir(sample_path):
+    if not base_dir.is_dir():
+        return [], False
+    
+    # Phase 1: scan directory structure for real samples. DirEntry caches the
+    # file type from readdir, so no extra stat() calls are needed per entry.
+    sample_dirs = []
+    with os.scandir(base_dir) as category_entries:
+        for category_entry in category_entries:
+            if not category_entry.is_dir():
                 continue
-                
-            # Check for required files
-            anechoic_path = os.path.join(sample_path, "dry_audio.wav")
-            generated_path = os.path.join(sample_path, "text2reverb_long_wet.wav")
-            ground_truth_path = os.path.join(sample_path, "ground_truth_wet.wav")
-            image_generated_path = os.path.join(sample_path, "image2reverb_wet.wav")
-            text_prompt_path = os.path.join(sample_path, "long_description.txt")
-            
-            # Load text prompt if available
-            if os.path.exists(text_prompt_path):
-                with open(text_prompt_path, 'r') as f:
-                    text_prompt = f.read().strip()
-            else:
-                # Use demo prompt as fallback
-                sample_num = int(sample_dir.split('_')[-1]) if '_' in sample_dir else 0
-                text_prompt = get_demo_text_prompt(category, sample_num)
-            
-            # Add sample for text2reverb if exists
-            if os.path.exists(anechoic_path) and os.path.exists(generated_path):
-                samples.append({
-                    'id': f"{category}_{sample_dir}_text2reverb",
-                    'category': category,
-                    'condition': 'text2reverb',  # Keep for backend tracking
-                    'sample_dir': sample_dir,
-                    'text_prompt': text_prompt,
-                    'anechoic_path': anechoic_path,
-                    'reverb_path': generated_path
-                })
-            
-            # Add sample for ground truth reverb if exists
-            if os.path.exists(anechoic_path) and os.path.exists(ground_truth_path):
-                samples.append({
-                    'id': f"{category}_{sample_dir}_ground_truth",
-                    'category': category,
-                    'condition': 'ground_truth',  # Keep for backend tracking
-                    'sample_dir': sample_dir,
-                    'text_prompt': text_prompt,
-                    'anechoic_path': anechoic_path,
-                    'reverb_path': ground_truth_path
-                })
             
-            # Add sample for image2reverb if exists
-            if os.path.exists(anechoic_path) and os.path.exists(image_generated_path):
-                samples.append({
-                    'id': f"{category}_{sample_dir}_image2reverb",
-                    'category': category,
-                    'condition': 'image2reverb',  # Keep for backend tracking
-                    'sample_dir': sample_dir,
-                    'text_prompt': text_prompt,
-                    'anechoic_path': anechoic_path,
-                    'reverb_path': image_generated_path
-                })
-    
-    if not samples:
-        st.warning("No evaluation samples found in the directory structure.")
-    
-    return samples
+            with os.scandir(category_entry.path) as sample_entries:
+                for sample_entry in sample_entries:
+                    if not sample_entry.is_dir():
+                        continue
+                    
+                    # List the sample directory once and probe membership
+                    # instead of stat-ing each expected file
+                    with os.scandir(sample_entry.path) as file_entries:
+                        files = {e.name for e in file_entries if e.is_file()}
+                    
+                    sample_dirs.append((
+                        category_entry.name,
+                        sample_entry.name,
+                        Path(sample_entry.path),
+                        files
+                    ))
+    
+    # Phase 2: read all text prompts in one pass, separate from the walk
+    text_prompts = []
+    for category, sample_dir, sample_path, files in sample_dirs:
+        if "long_description.txt" in files:
+            text_prompt_path = sample_path / "long_description.txt"
+            text_prompts.append(text_prompt_path.read_text(encoding='utf-8').strip())
+        else:
+            # Use demo prompt as fallback
+            sample_num = int(sample_dir.split('_')[-1]) if '_' in sample_dir else 0
+            text_prompts.append(get_demo_text_prompt(category, sample_num))
+    
+    # Phase 3: build one sample per available reverb condition
+    for (category, sample_dir, sample_path, files), text_prompt in zip(sample_dirs, text_prompts):
+        # Check for required files
+        if "dry_audio.wav" not in files:
+            continue
+        anechoic_path = str(sample_path / "dry_audio.wav")
+        generated_path = str(sample_path / "text2reverb_long_wet.wav")
+        ground_truth_path = str(sample_path / "ground_truth_wet.wav")
+        image_generated_path = str(sample_path / "image2reverb_wet.wav")
+        
+        # Add sample for text2reverb if exists
+        if "text2reverb_long_wet.wav" in files:
+            samples.append({
+                'id': f"{category}_{sample_dir}_text2reverb",
+                'category': category,
+                'condition': 'text2reverb',  # Keep for backend tracking
+                'sample_dir': sample_dir,
+                'text_prompt': text_prompt,
+                'anechoic_path': anechoic_path,
+                'reverb_path': generated_path
+            })
+        
+        # Add sample for ground truth reverb if exists
+        if "ground_truth_wet.wav" in files:
+            samples.append({
+                'id': f"{category}_{sample_dir}_ground_truth",
+                'category': category,
+                'condition': 'ground_truth',  # Keep for backend tracking
+                'sample_dir': sample_dir,
+                'text_prompt': text_prompt,
+                'anechoic_path': anechoic_path,
+                'reverb_path': ground_truth_path
+            })
+        
+        # Add sample for image2reverb if exists
+        if "image2reverb_wet.wav" in files:
+            samples.append({
+                'id': f"{category}_{sample_dir}_image2reverb",
+                'category': category,
+                'condition': 'image2reverb',  # Keep for backend tracking
+                'sample_dir': sample_dir,
+                'text_prompt': text_prompt,
+                'anechoic_path': anechoic_path,
+                'reverb_path': image_generated_path
+            })
+    
+    # Precompute widget keys so the rating UI does not rebuild them per rerun
+    for sample in samples:
+        sample['quality_key'] = f"quality_{sample['id']}"
+        sample['match_key'] = f"match_{sample['id']}"
+    
+    return samples, True
+
+@st.cache_resource(show_spinner=False)
+def load_audio_blobs(paths):
+    """Read every audio file used by the study into memory in one pass
+
+    Cached as a resource so all sessions share the same read-only dict.
+    """
+    return {path: Path(path).read_bytes() for path in paths}
 
 def get_demo_text_prompt(category, sample_num):
     """Generate demo text prompts based on category"""
-    prompts = {
-        'small': [
-            "A small tiled bathroom with hard surfaces and minimal absorption",
-            "A compact bedroom with carpet flooring and soft furnishings"
-        ],
-        'medium': [
-            "A medium-sized classroom with concrete walls and large windows",
-            "A living room with wooden floors and moderate furnishing"
-        ],
-        'large': [
-            "A large cathedral with stone walls and high vaulted ceilings",
-            "A spacious concert hall with acoustic treatment panels"
-        ],
-        'outdoor': [
-            "An open field with no nearby reflective surfaces",
-            "A desert landscape with distant rock formations"
-        ]
-    }
-    
     # Handle categories not in prompts or sample_num out of range
-    if category not in prompts:
+    if category not in DEMO_PROMPTS:
         return f"A {category} space"
     
-    prompt_list = prompts[category]
+    prompt_list = DEMO_PROMPTS[category]
     if sample_num >= len(prompt_list):
         return prompt_list[0]  # Default to first prompt if index out of range
     
@@ -176,8 +228,10 @@ def evaluation_interface():
         show_completion()
         return
     
-    # Get current sample
+    # Get current sample and pull out the fields used below
     sample = samples[sample_order[current_idx]]
+    sample_id = sample['id']
+    audio_blobs = st.session_state.audio_blobs
 
     st.markdown("---")
     
@@ -188,24 +242,17 @@ def evaluation_interface():
         unsafe_allow_html=True
     )
     
-    # Audio players
+    # Audio players (load_evaluation_samples only keeps samples whose files
+    # exist, and their contents are already prefetched)
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("**Dry Audio (Original):**")
-        anechoic_path = sample['anechoic_path']
-        if os.path.exists(anechoic_path):
-            st.audio(anechoic_path, format="audio/wav")
-        else:
-            st.warning(f"Anechoic audio file not found: {anechoic_path}")
+        st.audio(audio_blobs[sample['anechoic_path']], format="audio/wav")
     
     with col2:
         st.markdown("**Wet Audio (With Reverb):**")
-        reverb_path = sample['reverb_path']
-        if os.path.exists(reverb_path):
-            st.audio(reverb_path, format="audio/wav")
-        else:
-            st.warning(f"Reverb audio file not found: {reverb_path}")
+        st.audio(audio_blobs[sample['reverb_path']], format="audio/wav")
     
     # Rating scales (following Image2Reverb's approach)
     st.markdown("---")
@@ -218,11 +265,11 @@ def evaluation_interface():
         - 5 = Excellent""")
     
     # Load previous ratings if they exist
-    existing_rating = st.session_state.ratings.get(sample['id'], {})
+    existing_rating = st.session_state.ratings.get(sample_id, {})
     
-    # Define keys for this sample's widgets
-    quality_key = f"quality_{sample['id']}"
-    match_key = f"match_{sample['id']}"
+    # Keys for this sample's widgets
+    quality_key = sample['quality_key']
+    match_key = sample['match_key']
     
     # Quality rating
     quality_rating = st.slider(
@@ -248,67 +295,39 @@ def evaluation_interface():
     # Add some spacing before buttons
     st.markdown("---")
     
-    # Navigation buttons
+    def _save():
+        st.session_state.ratings[sample_id] = {
+            'sample_id': sample_id,
+            'category': sample['category'],
+            'condition': sample['condition'],  # Track which reverb type (hidden from user)
+            'quality': st.session_state[quality_key],
+            'match': st.session_state[match_key],
+            'order_presented': current_idx
+        }
+    
+    # Navigation buttons: Previous on the left (not shown for the first
+    # sample), Next/Submit aligned right
+    col1, _, _, _, col5 = st.columns([1, 1, 1, 1, 1])
+    
     if current_idx > 0:
-        # If not first sample, show both buttons
-        col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 1])
-        
-        # Previous button
         with col1:
             if st.button("← Previous", key=f"prev_{current_idx}", type="primary", use_container_width=True):
                 # Save current ratings before moving
-                st.session_state.ratings[sample['id']] = {
-                    'sample_id': sample['id'],
-                    'category': sample['category'],
-                    'condition': sample['condition'],  # Track which reverb type (hidden from user)
-                    'quality': st.session_state[quality_key],
-                    'match': st.session_state[match_key],
-                    'order_presented': current_idx
-                }
+                _save()
                 st.session_state.current_sample_idx -= 1
                 st.rerun()
+    
+    with col5:
+        is_last_sample = current_idx == len(sample_order) - 1
+        button_text = "Submit" if is_last_sample else "Next →"
         
-        # Next/Submit button aligned right
-        with col5:
-            is_last_sample = current_idx == len(sample_order) - 1
-            button_text = "Submit" if is_last_sample else "Next →"
-            
-            if st.button(button_text, key=f"next_{current_idx}", type="primary", use_container_width=True):
-                # Save ratings
-                st.session_state.ratings[sample['id']] = {
-                    'sample_id': sample['id'],
-                    'category': sample['category'],
-                    'condition': sample['condition'],  # Track which reverb type (hidden from user)
-                    'quality': st.session_state[quality_key],
-                    'match': st.session_state[match_key],
-                    'order_presented': current_idx
-                }
-                
-                # Move to next sample
-                st.session_state.current_sample_idx += 1
-                st.rerun()
-    else:
-        # If first sample, only show Next button aligned right
-        col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 1])
-        
-        with col5:
-            is_last_sample = current_idx == len(sample_order) - 1
-            button_text = "Submit" if is_last_sample else "Next →"
+        if st.button(button_text, key=f"next_{current_idx}", type="primary", use_container_width=True):
+            # Save ratings
+            _save()
             
-            if st.button(button_text, key=f"next_{current_idx}", type="primary", use_container_width=True):
-                # Save ratings
-                st.session_state.ratings[sample['id']] = {
-                    'sample_id': sample['id'],
-                    'category': sample['category'],
-                    'condition': sample['condition'],  # Track which reverb type (hidden from user)
-                    'quality': st.session_state[quality_key],
-                    'match': st.session_state[match_key],
-                    'order_presented': current_idx
-                }
-                
-                # Move to next sample
-                st.session_state.current_sample_idx += 1
-                st.rerun()
+            # Move to next sample
+            st.session_state.current_sample_idx += 1
+            st.rerun()
 
 def save_to_github_gist(results):
     """Save evaluation results to GitHub Gist"""
@@ -355,6 +374,12 @@ def save_to_github_gist(results):
     except Exception as e:
         return False, f"Error saving to GitHub: {str(e)}"
 
+def dump_results(results):
+    """Serialize results to indented JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(results, option=orjson.OPT_INDENT_2)
+    return json.dumps(results, indent=2).encode('utf-8')
+
 def show_completion():
     """Show completion screen and save results"""
     st.balloons()
@@ -367,9 +392,10 @@ def show_completion():
     }
     
     # Save to JSON file locally (backup)
-    filename = f"{RESULTS_DIR}/evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(filename, 'w') as f:
-        json.dump(results, f, indent=2)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    session_start = st.session_state.session_start.strftime('%Y%m%d_%H%M%S')
+    filename = f"{RESULTS_DIR}/evaluation_{session_start}_{st.session_state.session_token}.json"
+    Path(filename).write_bytes(dump_results(results))
     
     # Try to save to GitHub Gist
     success, message = save_to_github_gist(results)
@@ -398,19 +424,21 @@ def main():
     
     # Initialize samples if not already done
     if st.session_state.samples is None:
-        samples = load_evaluation_samples()
+        samples, found = load_evaluation_samples(SAMPLES_DIR)
+        if not found:
+            st.error(f"Evaluation samples directory not found: {SAMPLES_DIR}")
+        elif not samples:
+            st.warning("No evaluation samples found in the directory structure.")
         
         # Group samples by sample_dir to keep same text descriptions together
         sample_groups = {}
         for idx, sample in enumerate(samples):
-            key = f"{sample['category']}_{sample['sample_dir']}"
-            if key not in sample_groups:
-                sample_groups[key] = []
-            sample_groups[key].append(idx)
+            key = (sample['category'], sample['sample_dir'])
+            sample_groups.setdefault(key, []).append(idx)
         
         # Randomize the order of groups and reverb types within each group
         randomized_order = []
-        group_keys = list(sample_groups.keys())
+        group_keys = list(sample_groups)
         random.shuffle(group_keys)  # Randomize order of text descriptions
         
         for key in group_keys:
@@ -418,6 +446,13 @@ def main():
             random.shuffle(group_indices)  # Randomize order of reverb types within group
             randomized_order.extend(group_indices)
         
+        # Prefetch all audio up front instead of reading per sample
+        audio_paths = dict.fromkeys(
+            path for sample in samples
+            for path in (sample['anechoic_path'], sample['reverb_path'])
+        )
+        st.session_state.audio_blobs = load_audio_blobs(tuple(audio_paths))
+        
         st.session_state.sample_order = randomized_order
         st.session_state.samples = samples
     